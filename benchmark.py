@@ -0,0 +1,152 @@
+import argparse
+import json
+import sys
+from collections import Counter
+
+import parser
+from blocks import rule_css
+from emulator import Emulator
+from main import build
+from netlist import Netlist
+from simulator import Simulator
+
+# each case loads P into the accumulator, then runs the instruction being measured
+CASES = [
+    ("EXIT", "LOAD P\nEXIT", 5, 0),
+    ("LOAD", "LOAD P\nLOAD Q\nEXIT", 0x5A, 0xA5),
+    ("STOR", "LOAD P\nSTOR Q\nEXIT", 0x5A, 0xA5),
+    ("ADD", "LOAD P\nADD Q\nEXIT", 0x0D, 0x11),
+    ("ADD full carry chain", "LOAD P\nADD Q\nEXIT", 0xFF, 0x01),
+    ("SWAP", "LOAD P\nSWAP Q\nEXIT", 0x5A, 0xA5),
+    ("MULT", "LOAD P\nMULT Q\nEXIT", 0x0D, 0x11),
+    ("MULT by 0", "LOAD P\nMULT Q\nEXIT", 0x0D, 0x00),
+    ("MULT by 1", "LOAD P\nMULT Q\nEXIT", 0x0D, 0x01),
+    ("INV", "LOAD P\nINV\nEXIT", 0x5A, 0),
+    ("GOTO", "LOAD P\nGOTO 4\nEXIT\nEXIT", 5, 0),
+    ("SKIP taken", "LOAD P\nSKIP Q\nEXIT\nEXIT", 5, 1),
+    ("SKIP not taken", "LOAD P\nSKIP Q\nEXIT\nEXIT", 5, 0),
+    ("LEAP", "LOAD P\nLEAP Q\nEXIT\nEXIT", 5, 3),
+    ("INDX", "LOAD P\nINDX Q\nEXIT", 5, 3),
+    ("EQ equal", "LOAD P\nEQ Q\nEXIT", 0x5A, 0x5A),
+    ("EQ not equal", "LOAD P\nEQ Q\nEXIT", 0x5A, 0x5B),
+    ("GTEQ greater", "LOAD P\nGTEQ Q\nEXIT", 0x80, 0x7F),
+    ("GTEQ less", "LOAD P\nGTEQ Q\nEXIT", 0x7F, 0x80),
+]
+
+
+def run_case(code, p, q, memory_size=64, multiplier="array", alu_slice_width=1, max_selector_depth=None,
+             max_selector_length=None):
+    text = f"{code}\n\nDATA:\nP = {p:X}\nQ = {q:X}"
+    starting_memory = parser.parse(text, show_var_locations=False)
+    hardware = build(
+        starting_memory, memory_size, max_selector_depth=max_selector_depth, max_selector_length=max_selector_length,
+        multiplier=multiplier, alu_slice_width=alu_slice_width
+    )
+    netlist = Netlist.from_hardware(hardware)
+    staged = {bit.id_ for bit in hardware.staged}
+    simulator = Simulator(netlist)
+
+    phase_start = simulator.label_bits("phase")[0]
+    freezer = simulator.label_bits("freezer")[0]
+    watched = set(simulator.label_bits("accumulator"))
+    for _, label in netlist.labels:
+        if label.startswith("mem section"):
+            watched.update(simulator.label_bits(label))
+
+    # the measured instruction is the second one, so it runs from the second time the
+    # phase chain starts until the third time or until the freezer stops the computer
+    starts = 0
+    start_tick = None
+    fired_before = None
+    last_change = None
+    while not simulator.state[freezer] and starts < 3:
+        id_ = simulator.tick()
+        if id_ is None:
+            break
+        if id_ == phase_start and simulator.state[id_]:
+            starts += 1
+            if starts == 2:
+                start_tick = simulator.ticks
+                fired_before = Counter(simulator.fired)
+        elif start_tick is not None and id_ in watched:
+            last_change = simulator.ticks
+
+    if start_tick is None:
+        raise RuntimeError("the measured instruction never started")
+    fired = simulator.fired - fired_before
+
+    emulator = Emulator(starting_memory, memory_size)
+    emulator.step()
+    emulator.step()
+    correct = all(
+        simulator.value(label) == emulator.memory[int(label.split()[-1])]
+        for _, label in netlist.labels
+        if label.startswith("mem section")
+    ) and simulator.value("accumulator") == emulator.accumulator
+
+    return {
+        "ticks": simulator.ticks - start_tick,
+        "settle": 0 if last_change is None else last_change - start_tick,
+        "rules fired": sum(fired.values()),
+        "distinct rules": len(fired),
+        # the ticks spent switching bits that only hold a staged expression
+        "staged": sum(count for rule, count in fired.items() if netlist.rules[rule][0] in staged),
+        "correct": correct,
+    }, netlist, fired
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="measure how many ticks each op code takes")
+    arg_parser.add_argument("--baseline", help="flag cases that got slower than this saved result")
+    arg_parser.add_argument("--save", help="save the results to use as a baseline later")
+    arg_parser.add_argument("--rules", action="store_true", help="print the rules that fired for each case")
+    arg_parser.add_argument("--multiplier", default="array", choices=["array", "sequential"])
+    arg_parser.add_argument("--alu-slice-width", type=int, default=1, help="bits ADD and GTEQ add without staging carries")
+    arg_parser.add_argument("--max-selector-depth", type=int, help="stage expressions nested deeper than this")
+    arg_parser.add_argument("--max-selector-length", type=int, help="stage expressions whose rules are longer than this")
+    args = arg_parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    results = {}
+    failed = False
+    print(f"{'case':<22}{'ticks':>7}{'settle':>8}{'rules':>7}{'distinct':>10}{'staged':>8}  notes")
+    for name, code, p, q in CASES:
+        result, netlist, fired = run_case(
+            code, p, q, multiplier=args.multiplier, alu_slice_width=args.alu_slice_width,
+            max_selector_depth=args.max_selector_depth, max_selector_length=args.max_selector_length
+        )
+        results[name] = result
+        notes = []
+        if not result["correct"]:
+            notes.append("WRONG RESULT")
+            failed = True
+        if name in baseline:
+            for key in ["ticks", "settle"]:
+                if result[key] > baseline[name][key]:
+                    notes.append(f"{key} regressed from {baseline[name][key]}")
+                    failed = True
+        print(
+            f"{name:<22}{result['ticks']:>7}{result['settle']:>8}{result['rules fired']:>7}"
+            f"{result['distinct rules']:>10}{result['staged']:>8}  {', '.join(notes)}"
+        )
+        if args.rules:
+            templates = netlist.templates()
+            for rule, count in fired.most_common():
+                id_, value, node = netlist.rules[rule]
+                css = rule_css(id_, value, None if node is None else templates[node])
+                print(f"    {count:>4}x {css}")
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=4)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
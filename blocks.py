@@ -1,7 +1,14 @@
+import gzip
 import operator
+import os
 import re
 from functools import reduce
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 MAX_BYTE = 0b11111111
 
 
@@ -13,6 +20,32 @@ def int_to_bool_list(hardware, num, width):
     return [(FalseBool, TrueBool)[bit](hardware) for bit in int_to_bin(num, width)]
 
 
+def sub_in(css, id_, reads_after=False):
+    # reads_after writes every bit css reads as if it came after id_, which is the longest way to write it
+    def inner(match):
+        oid = int(match.group(1))
+        if id_ > oid and not reads_after:
+            return f"#i{oid}:checked~#i{id_}"
+        else:
+            return f"#i{id_}:has(~#i{oid}:checked)"
+
+    rels_subbed = re.sub("%(\\d+)%", inner, css)
+    ids_subbed = rels_subbed.replace("$", f"#i{id_}")
+    return f":is({ids_subbed})"
+
+
+def rule_css(id_, value, css=None, reads_after=False):
+    selector = f"#i{id_}" if css is None else sub_in(css, id_, reads_after)
+    return selector + (":not(:checked)" if value else ":checked") + "{display:block;}"
+
+
+def bit_html(id_, value, group=None):
+    # none of the attributes need quotes, and there are thousands of these so every byte counts
+    if group is not None:
+        return f'<input type=radio name=g{group} id=i{id_}{" checked" if value else ""}>'
+    return f'<input type=checkbox id=i{id_}{" checked" if value else ""}>'
+
+
 def try_hash(val):
     try:
         return hash(val)
@@ -42,12 +75,39 @@ def cache(func):
 
 
 class Hardware:
-    def __init__(self):
+    def __init__(self, max_selector_depth=None, max_selector_length=None, radio_one_hot=False):
         self.bit_count = 0
         self.html = ""
         self.css = ""
         self.finishers = []
         self.labels = []
+        self.initial = []
+        self.rules = []
+        self.max_selector_depth = max_selector_depth
+        self.max_selector_length = max_selector_length
+        self.staged = []
+        # emitted rules that are over the budget anyway, because they can't be split up any further
+        self.over_budget = 0
+        # OneHots become radio buttons, (first id, last id) of each group
+        self.radio_one_hot = radio_one_hot
+        self.radio_groups = []
+
+    def fits(self, css, depth, id_=None, value=True):
+        # the length is measured on the emitted rule. while the bit it switches isn't known, the rule is
+        # measured in its longest form, with an id as long as the newest bit's
+        if self.max_selector_depth is not None and depth > self.max_selector_depth:
+            return False
+        if self.max_selector_length is not None:
+            if id_ is None:
+                rule = rule_css(self.bit_count, value, css, True)
+            else:
+                rule = rule_css(id_, value, css)
+            if len(rule) > self.max_selector_length:
+                return False
+        return True
+
+    def within_budget(self, value):
+        return self.fits(value.css, value.depth)
 
     def label(self, bits, name):
         bit_ids = [bit.id_ for bit in bits]
@@ -77,15 +137,29 @@ class Hardware:
         html += "</tbody></table>\n"
         return html
 
-    def bit(self, value=False):
+    def bit(self, value=False, group=None):
         id_ = self.bit_count
         self.bit_count += 1
-        self.html += f'<input type="checkbox" id="i{id_}"{" checked" if value else ""}>\n'
+        self.initial.append(bool(value))
+        self.html += bit_html(id_, value, group)
         return Bit(self, id_)
 
+    def radio_group(self, bits):
+        # radio buttons sharing a name, the browser unchecks the rest when one is checked
+        group = len(self.radio_groups)
+        self.radio_groups.append((self.bit_count, self.bit_count + bits - 1))
+        return Memory([self.bit(group=group) for _ in range(bits)])
+
     def add_css(self, css):
         self.css += css + "\n"
 
+    def add_rule(self, id_, value, css=None, depth=0):
+        # the bit is switched to value while css matches, or always if css is None
+        self.rules.append((id_, value, css))
+        self.add_css(rule_css(id_, value, css))
+        if css is not None and not self.fits(css, depth, id_, value):
+            self.over_budget += 1
+
     def alloc(self, bits):
         return Memory([self.bit() for _ in range(bits)])
 
@@ -99,21 +173,45 @@ class Hardware:
         for finisher in self.finishers:
             finisher()
 
-    def output(self, html_loc, css_loc):
+    def output(self, html_loc, css_loc, max_bytes=None):
+        # next to each file a .gz copy is written, and a .br copy if brotli is installed, so the server can
+        # send them as they are. without brotli an old .br copy is deleted so it can't be sent stale. if the
+        # html and css add up to more than max_bytes nothing is written
         debug_html = self.generate_debug()
         with open(html_loc) as file:
             html_template = file.read()
-        with open(html_loc, "w") as file:
-            insert_location = "(<!--HARDWARE START-->).*?(<!--HARDWARE END-->)"
-            result = re.sub(insert_location, fr"\1\n{self.html}\2", html_template, 1, re.DOTALL)
-            debug_location = "(<!--DEBUG START-->).*?(<!--DEBUG END-->)"
-            result = re.sub(debug_location, fr"\1\n{debug_html}\2", result, 1, re.DOTALL)
-            file.write(result)
+        insert_location = "(<!--HARDWARE START-->).*?(<!--HARDWARE END-->)"
+        html = re.sub(insert_location, fr"\1\n{self.html}\n\2", html_template, 1, re.DOTALL)
+        debug_location = "(<!--DEBUG START-->).*?(<!--DEBUG END-->)"
+        html = re.sub(debug_location, fr"\1\n{debug_html}\2", html, 1, re.DOTALL)
         with open(css_loc) as file:
             css_template = file.read()
-        with open(css_loc, "w") as file:
-            insert_location = r"(/\*HARDWARE START\*/).*?(/\*HARDWARE END\*/)"
-            file.write(re.sub(insert_location, fr"\1\n{self.css}\2", css_template, 1, re.DOTALL))
+        insert_location = r"(/\*HARDWARE START\*/).*?(/\*HARDWARE END\*/)"
+        css = re.sub(insert_location, fr"\1\n{self.css}\2", css_template, 1, re.DOTALL)
+
+        outputs = [(html_loc, html.encode()), (css_loc, css.encode())]
+        size = sum(len(data) for _, data in outputs)
+        if max_bytes is not None and size > max_bytes:
+            raise ValueError(f"The html and css are {size} bytes, over the budget of {max_bytes}")
+
+        if brotli is None:
+            print("brotli isn't installed, so no .br copies are written and old ones are deleted")
+        for loc, data in outputs:
+            compressed = {".gz": gzip.compress(data, 9, mtime=0)}
+            if brotli is not None:
+                compressed[".br"] = brotli.compress(data)
+            with open(loc, "wb") as file:
+                file.write(data)
+            if brotli is None and os.path.exists(loc + ".br"):
+                os.remove(loc + ".br")
+                print(f"deleted {loc}.br")
+            for extension, compressed_data in compressed.items():
+                with open(loc + extension, "wb") as file:
+                    file.write(compressed_data)
+            sizes = ", ".join(
+                f"{len(compressed_data)} {extension}" for extension, compressed_data in compressed.items()
+            )
+            print(f"wrote {loc}: {len(data)} bytes ({sizes})")
 
 
 class Bool:
@@ -133,7 +231,7 @@ class Bool:
         real_section = TrueBool(values[0].hardware)
         nonreal_section = TrueBool(values[0].hardware)
         if real:
-            real_section = CSSBool(real[0].hardware, ''.join([f":is({b.css})" for b in real]))
+            real_section = CSSBool.budgeted(real, CSSBool.all_of)
         if nonreal:
             nonreal_section = reduce(operator.and_, nonreal)
         return real_section & nonreal_section
@@ -144,7 +242,7 @@ class Bool:
         real_section = FalseBool(values[0].hardware)
         nonreal_section = FalseBool(values[0].hardware)
         if real:
-            real_section = CSSBool(values[0].hardware, ",".join([value.css for value in values]))
+            real_section = CSSBool.budgeted(real, CSSBool.any_of)
         if nonreal:
             nonreal_section = reduce(operator.or_, nonreal)
         return real_section | nonreal_section
@@ -201,22 +299,91 @@ class FalseBool(Bool):
 
 
 class CSSBool(Bool):
-    def __init__(self, hardware, css):
+    def __init__(self, hardware, css, depth=0):
         super().__init__(hardware)
         self.css = css
+        self.depth = depth
+        # the negation, so negating twice gives back the original instead of nesting deeper
+        self.inverse = None
+        # (values, combine) it was built from, so it can be built again with more of them staged
+        self.parts = None
+
+    @staticmethod
+    def all_of(values):
+        return CSSBool(
+            values[0].hardware,
+            ''.join([f":is({value.css})" for value in values]),
+            max(value.depth for value in values) + 1,
+        )
+
+    @staticmethod
+    def any_of(values):
+        return CSSBool(
+            values[0].hardware,
+            ",".join([value.css for value in values]),
+            max(value.depth for value in values),
+        )
+
+    @staticmethod
+    def budgeted(values, combine, negate=False):
+        # stages values until their combination, or its negation with negate, is within budget
+        hardware = values[0].hardware
+
+        def combined(values):
+            result = combine(values)
+            return result, result.negation() if negate else result
+
+        result, checked = combined(values)
+        # when even two bits can't be combined within budget, staging wouldn't make anything fit
+        placeholder = Bit(hardware, hardware.bit_count)
+        if hardware.within_budget(combined([placeholder, placeholder])[1]):
+            while not hardware.within_budget(checked):
+                stageable = [value for value in values if not isinstance(value, Bit)]
+                if stageable:
+                    if hardware.within_budget(CSSBool(hardware, checked.css)):
+                        worst = max(stageable, key=lambda value: value.depth)
+                    else:
+                        worst = max(stageable, key=lambda value: len(value.css))
+                    values = [value.stage() if value is worst else value for value in values]
+                elif len(values) > 2:
+                    half = len(values) // 2
+                    values = [
+                        CSSBool.budgeted(values[:half], combine).stage(),
+                        CSSBool.budgeted(values[half:], combine).stage(),
+                    ]
+                else:
+                    break
+                result, checked = combined(values)
+        result.parts = (values, combine)
+        if negate:
+            result.inverse = checked
+            checked.inverse = result
+        return result
 
     def __and__(self, other):
         if not isinstance(other, CSSBool):
             return other & self
-        return CSSBool(self.hardware, f":is({self.css}):is({other.css})")
+        return CSSBool.budgeted([self, other], CSSBool.all_of)
 
     def __or__(self, other):
         if not isinstance(other, CSSBool):
             return other | self
-        return CSSBool(self.hardware, f"{self.css},{other.css}")
+        return CSSBool.budgeted([self, other], CSSBool.any_of)
+
+    def negation(self):
+        return CSSBool(self.hardware, f"$:not({self.css})", self.depth + 1)
 
     def __invert__(self):
-        return CSSBool(self.hardware, f"$:not({self.css})")
+        if self.inverse is None:
+            inverse = self.negation()
+            if not self.hardware.within_budget(inverse) and self.parts is not None:
+                # built again with more of its parts staged so that the negation fits, negating that gives the
+                # rebuilt expression back, see Bit.iff
+                self.inverse = ~CSSBool.budgeted(*self.parts, negate=True)
+            else:
+                self.inverse = inverse
+                inverse.inverse = self
+        return self.inverse
 
     def __xor__(self, other):
         if not isinstance(other, CSSBool):
@@ -229,34 +396,23 @@ class CSSBool(Bool):
         return (self & other) | ~(self | other)
 
     def sub_in(self, id_):
-        def inner(match):
-            oid = int(match.group(1))
-            if id_ > oid:
-                return f"#i{oid}:checked~#i{id_}"
-            else:
-                return f"#i{id_}:has(~#i{oid}:checked)"
-
-        rels_subbed = re.sub("%(\\d+)%", inner, self.css)
-        ids_subbed = rels_subbed.replace("$", f"#i{id_}")
-        return f":is({ids_subbed})"
+        return sub_in(self.css, id_)
 
     def stage(self):
         bit = self.hardware.bit()
         bit.iff(self)
+        self.hardware.staged.append(bit)
         return bit
 
 
 class Bit(CSSBool):
-    SWITCH = "{display:block;}"
-
     def __init__(self, hardware, id_):
         super().__init__(hardware, f"%{id_}%")
         self.id_ = id_
 
     def if_(self, cond):
         if isinstance(cond, CSSBool):
-            selector = cond.sub_in(self.id_) + ":not(:checked)"
-            self.hardware.add_css(selector + self.SWITCH)
+            self.hardware.add_rule(self.id_, True, cond.css, cond.depth)
         elif isinstance(cond, FalseBool):
             pass
         elif isinstance(cond, TrueBool):
@@ -266,8 +422,7 @@ class Bit(CSSBool):
 
     def not_if(self, cond):
         if isinstance(cond, CSSBool):
-            selector = cond.sub_in(self.id_) + ":checked"
-            self.hardware.add_css(selector + self.SWITCH)
+            self.hardware.add_rule(self.id_, False, cond.css, cond.depth)
         elif isinstance(cond, FalseBool):
             pass
         elif isinstance(cond, TrueBool):
@@ -275,28 +430,38 @@ class Bit(CSSBool):
         else:
             raise TypeError()
 
+    @staticmethod
+    def both(cond):
+        # cond and its negation read the same bits. if cond was rebuilt so its negation fits the budget, a
+        # rule reading the original could disagree with one reading the negation while the staged bits settle
+        inverse = ~cond
+        return ~inverse, inverse
+
     def iff(self, cond):
+        cond, inverse = self.both(cond)
         self.if_(cond)
-        self.not_if(~cond)
+        self.not_if(inverse)
 
     def iff_when(self, cond, when):
         if when is None:
             self.iff(cond)
         else:
+            cond, inverse = self.both(cond)
             self.if_(cond & when)
-            self.not_if(~cond & when)
+            self.not_if(inverse & when)
 
     def iff_not(self, cond):
-        self.if_(~cond)
+        cond, inverse = self.both(cond)
+        self.if_(inverse)
         self.not_if(cond)
 
     def iff_not_when(self, cond, when):
-        self.if_(~cond & when)
+        cond, inverse = self.both(cond)
+        self.if_(inverse & when)
         self.not_if(cond & when)
 
     def set(self, value):
-        selector = f"#i{self.id_}" + (":not(:checked)" if value else ":checked")
-        self.hardware.add_css(selector + self.SWITCH)
+        self.hardware.add_rule(self.id_, value)
 
     def __repr__(self):
         return f"Bit({self.id_})"
@@ -414,17 +579,47 @@ class BitChain:
     def __init__(self, hardware, n):
         self.hardware = hardware
         self.bits = hardware.alloc(n)
-        self.bits[0].iff(~self.bits[n - 1])
-        for i, bit in enumerate(self.bits[1:]):
-            bit.iff(self.bits[i])
+        self.stop_whens = [[] for _ in range(n)]
+        self.wait_whens = []
+        hardware.register_finisher(self.finish)
+
+    def finish(self):
+        n = len(self.bits)
+        stops = [
+            Bool.or_(*whens) if whens else FalseBool(self.hardware)
+            for whens in self.stop_whens
+        ]
+        restart = Bool.or_(self.bits[n - 1], *(
+            self.bits[i] & stop
+            for i, stop in enumerate(stops)
+            if not isinstance(stop, FalseBool)
+        ))
+        self.bits[0].iff(~restart)
+        start = self.bits[0] & ~stops[0]
+        if self.wait_whens:
+            start = start & ~Bool.or_(*self.wait_whens)
+        self.bits[1].iff(start)
+        for i, bit in enumerate(self.bits[2:], 1):
+            bit.iff(self.bits[i] & ~stops[i])
+
+    def stop_after(self, n, when):
+        # the chain falls back to 0 once phase n is done instead of running to the end
+        if n < len(self.bits) - 1:
+            self.stop_whens[n].append(when)
+
+    def wait(self, when):
+        # the chain stays in phase 0 while when holds
+        self.wait_whens.append(when)
 
     def at_least(self, n):
         return self.bits[n] & self.bits[0]
 
     def exactly(self, n):
+        if n == 0:
+            return self.bits[0] & ~self.bits[1]
         if n == len(self.bits) - 1:
             return self.bits[n] & self.bits[0]
-        return self.bits[n] & ~self.bits[n + 1]
+        return self.bits[n] & ~self.bits[n + 1] & self.bits[0]
 
     def label(self, label):
         self.bits.label(label)
@@ -432,28 +627,32 @@ class BitChain:
 
 class OneHot(Memory):
     def __init__(self, hardware, options):
-        super().__init__(hardware.alloc(options))
+        self.radio = hardware.radio_one_hot
+        super().__init__(hardware.radio_group(options) if self.radio else hardware.alloc(options))
         self.options = options
 
     def set_source(self, source, when=None):
         for i in range(self.options):
-            self.bools[i].iff_when(source == i, when)
+            if self.radio:
+                # checking the option unchecks the old one, so only checking needs a rule. an out of
+                # range source leaves the old option checked instead of clearing them all
+                self.bools[i].if_(source == i if when is None else (source == i) & when)
+            else:
+                self.bools[i].iff_when(source == i, when)
 
 
 class Array:
-    def __init__(self, hardware, size, elem_bits, index_bits, initial=None):
+    # with read ports every read has its own index, so reads can overlap with a write. without any,
+    # reads share the write index and come out of out
+    def __init__(self, hardware, size, elem_bits, index_bits, initial=None, read_ports=0):
         if initial is None:
             initial = []
         self.hardware = hardware
         self.index_bits = index_bits
         self.size = size
         self.elem_bits = elem_bits
-        self.out = MemNumber(hardware, elem_bits)
-        self.mem_sections = [
-            (hardware.alloc(elem_bits) if i >= len(initial)
-             else hardware.const(int_to_bin(initial[i], elem_bits)))
-            for i in range(size)
-        ]
+        self.out = None if read_ports else MemNumber(hardware, elem_bits)
+        self.mem_sections = self.alloc_sections(hardware, size, elem_bits, initial)
         self.mem = Memory.merge(self.mem_sections)
         self.write_mode = hardware.bit()
         self.write_when = []
@@ -464,20 +663,37 @@ class Array:
 
         for i in range(size):
             self.mem_sections[i].assign(self.in_, self.index_marker[i] & self.write_mode)
-            self.out.assign(self.mem_sections[i], self.index_marker[i])
+            if self.out is not None:
+                self.out.assign(self.mem_sections[i], self.index_marker[i])
+
+        self.ports = [ReadPort(hardware, self.mem_sections, index_bits) for _ in range(read_ports)]
 
         hardware.register_finisher(self.finish)
 
+    @staticmethod
+    def alloc_sections(hardware, size, elem_bits, initial):
+        return [
+            (hardware.alloc(elem_bits) if i >= len(initial)
+             else hardware.const(int_to_bin(initial[i], elem_bits)))
+            for i in range(size)
+        ]
+
     def finish(self):
         if self.write_when:
-            self.write_mode.iff(Bool.or_(*self.write_when))
+            write = Bool.or_(*self.write_when)
+            if self.index_marker.radio:
+                # an index past the end leaves the last marker checked, so it mustn't write there
+                write = write & self.index.less_than(self.size)
+            self.write_mode.iff(write)
 
     def set(self, new_index, value, when):
         self.index.assign(new_index, when)
         self.in_.assign(value, when)
         self.write_when.append(when)
 
-    def get(self, new_index, when):
+    def get(self, new_index, when, port=0):
+        if self.ports:
+            return self.ports[port].get(new_index, when)
         self.index.assign(new_index, when)
         return self.out
 
@@ -485,6 +701,55 @@ class Array:
         return self.mem_sections[item]
 
 
+class ReadPort:
+    def __init__(self, hardware, sections, index_bits):
+        self.out = MemNumber(hardware, len(sections[0]))
+        self.index_marker = OneHot(hardware, len(sections))
+        self.index = MemNumber(hardware, index_bits)
+        self.index_marker.set_source(self.index)
+
+        for marker, section in zip(self.index_marker, sections):
+            self.out.assign(section, marker)
+
+    def get(self, new_index, when):
+        self.index.assign(new_index, when)
+        return self.out
+
+
+class SplitMemory:
+    # the lowest addresses go to a small private array and the rest to a shared one, both need
+    # the same read ports, the shared array's first sections are left unused
+    def __init__(self, private, shared):
+        self.private_bits = (private.size - 1).bit_length()
+        if private.size < 2 or 1 << self.private_bits != private.size:
+            raise ValueError("The private memory size has to be a power of 2")
+        self.private = private
+        self.shared = shared
+        # the output of each read port, staged once so the selectors reading it stay short
+        self.outs = {}
+
+    def is_private(self, index):
+        return Bool.and_(*(~bit for bit in list(index)[self.private_bits:]))
+
+    def set(self, new_index, value, when):
+        is_private = self.is_private(new_index)
+        self.private.set(new_index, value, when & is_private)
+        self.shared.set(new_index, value, when & ~is_private)
+
+    def get(self, new_index, when, port=0):
+        private_out = self.private.get(new_index, when, port)
+        shared_out = self.shared.get(new_index, when, port)
+        if port not in self.outs:
+            is_private = self.is_private(self.shared.ports[port].index)
+            self.outs[port] = Number.stage((private_out & is_private) | (shared_out & ~is_private))
+        return self.outs[port]
+
+    def __getitem__(self, item):
+        if item < self.private.size:
+            return self.private[item]
+        return self.shared[item]
+
+
 class Number(Bools):
     def __init__(self, hardware, width, bools):
         self.hardware = hardware
@@ -511,6 +776,18 @@ class Number(Bools):
             return super().__ne__(other)
         raise TypeError()
 
+    def less_than(self, other):
+        # other is an int, going down from the top the first bit that differs has to be 1 in other
+        if other >= 1 << self.width:
+            return TrueBool(self.hardware)
+        terms = []
+        higher_equal = []
+        for target, bit in reversed(list(zip(int_to_bin(other, self.width), self))):
+            if target:
+                terms.append(Bool.and_(~bit, *higher_equal))
+            higher_equal.append(bit if target else ~bit)
+        return Bool.or_(*terms) if terms else FalseBool(self.hardware)
+
     @cache
     def greater_or_equal(self, other, when, carries=None):
         if carries is None:
@@ -568,29 +845,13 @@ class Number(Bools):
 
     @cache
     def add(self, other, when, carries=None):
-        if carries is None:
-            carries = [self.hardware.bit() for _ in range(self.width - 2)]
-        result = []
-
         if isinstance(other, Number):
-            carry = None
-            store_next_carry = False
-            for ab, bb in zip(self, other):
-                if store_next_carry:
-                    carry_expr = carry
-                    carry = carries.pop()
-                    carry.iff_when(carry_expr, when)
-                if carry is None:
-                    new = ab ^ bb
-                    carry = ab & bb
-                else:
-                    new = Bool.xor(ab, bb, carry)
-                    carry = (ab & bb) | (carry & (ab | bb))
-                    store_next_carry = True
-                result.append(new)
-            return Number(self.hardware, self.width, result)
+            return self.full_add(other, None, when, carries)[0]
 
         elif isinstance(other, int):
+            if carries is None:
+                carries = [self.hardware.bit() for _ in range(self.width - 2)]
+            result = []
             carry = None
             store_next_carry = False
             for ab, bb in zip(self, int_to_bin(other, self.width)):
@@ -612,9 +873,58 @@ class Number(Bools):
 
         return Number(self.hardware, self.width, result)
 
+    @staticmethod
+    def full_add_carry_count(width, slice_width=1, carry_in=True):
+        if carry_in or slice_width != 1:
+            return (width - 1) // slice_width
+        return max(width - 2, 0)
+
+    def full_add(self, other, carry_in, when, carries=None, slice_width=1):
+        # the carry into each slice of slice_width bits is staged, inside a slice every carry is worked
+        # out straight from the slice's input bits like a lookup table. wider slices need fewer ticks for
+        # the carries to ripple through but longer selectors, 1 stages the carry into every bit
+        # with carry_in None and slices of 1 bit nothing carries in, so the carry out of the first bit is
+        # short enough to be used without staging it
+        if carries is None:
+            carries = [
+                self.hardware.bit()
+                for _ in range(self.full_add_carry_count(self.width, slice_width, carry_in is not None))
+            ]
+        result = []
+        slice_carry = FalseBool(self.hardware) if carry_in is None else carry_in
+        generates = []
+        propagates = []
+        for i, (ab, bb) in enumerate(zip(self, other)):
+            if i > 0 and i % slice_width == 0:
+                if carry_in is None and i == 1 and slice_width == 1:
+                    slice_carry = carry
+                else:
+                    carry_expr = carry
+                    slice_carry = carries.pop()
+                    slice_carry.iff_when(carry_expr, when)
+                generates = []
+                propagates = []
+            if not generates:
+                carry = slice_carry
+            result.append(Bool.xor(ab, bb, carry))
+            generates.append(ab & bb)
+            propagates.append(ab | bb)
+            # the carry out of this bit, generated by one of the slice's bits and propagated by all the
+            # bits above it, or coming into the slice and propagated by all of them
+            carry = reduce(operator.or_, [
+                *(reduce(operator.and_, [generate, *propagates[j + 1:]]) for j, generate in enumerate(generates)),
+                reduce(operator.and_, [slice_carry, *propagates]),
+            ])
+        return Number(self.hardware, self.width, result), carry
+
+    @staticmethod
+    def mult_carry_count(width):
+        # the stage registers and adder carries mult_no_special needs, this grows with width^2
+        return 2*width*width - 3*width + 2
+
     def mult_no_special(self, other, when, carries=None):
         if carries is None:
-            carries = [self.hardware.bit() for _ in range(2*self.width*self.width-3*self.width+2)]
+            carries = [self.hardware.bit() for _ in range(self.mult_carry_count(self.width))]
         result = None
         for i in range(self.width):
             addend = self.left_shift_nowrap(i) & other[i]
@@ -722,3 +1032,91 @@ class Counter(MemNumber):
     @cache
     def count(self, when):
         self.count_whens.append(when)
+
+
+class SequentialMultiplier:
+    # shift-and-add multiplier that reuses one adder for every bit of the multiplier, so
+    # it needs O(width) bits instead of the O(width^2) of Number.mult
+    def __init__(self, hardware, width):
+        # allocated first so it only toggles once the registers below have settled
+        self.half = hardware.bit()
+        self.hardware = hardware
+        self.width = width
+        self.product = MemNumber(hardware, width)
+        self.multiplicand = MemNumber(hardware, width)
+        self.multiplier = MemNumber(hardware, width)
+        self.next_multiplicand = MemNumber(hardware, width)
+        self.next_multiplier = MemNumber(hardware, width)
+        self.sum = MemNumber(hardware, width)
+        self.carries = hardware.alloc(width - 2)
+        self.whens = []
+
+    def multiply(self, multiplicand, multiplier, start, run):
+        # start loads the operands, then while run holds the multiplier steps until it is done
+        self.multiplicand.assign(multiplicand, start)
+        self.multiplier.assign(multiplier, start)
+        self.product.assign(Number.zero(self.hardware, self.width), start)
+
+        running = run & self.multiplier.is_truthy()
+        stepping = running & ~self.half
+        addend = self.multiplicand & self.multiplier[0]
+        self.sum.assign(self.product.add(addend, stepping, list(self.carries)), stepping)
+        self.next_multiplicand.assign(self.multiplicand.left_shift_nowrap(1), stepping)
+        self.next_multiplier.assign(self.multiplier.right_shift_nowrap(1), stepping)
+
+        latching = run & self.half
+        self.product.assign(self.sum, latching)
+        self.multiplicand.assign(self.next_multiplicand, latching)
+        self.multiplier.assign(self.next_multiplier, latching)
+
+        if not self.whens:
+            self.hardware.register_finisher(self.finish)
+        self.whens.append(running)
+        return self.product, run & ~self.multiplier.is_truthy() & ~self.half
+
+    def finish(self):
+        self.half.if_(Bool.or_(*self.whens))
+        self.half.set(False)
+
+
+class RoundRobin:
+    # gives one user at a time a grant, in turn. a user keeps it until it has been busy and then
+    # stopped being busy, users that skip pass it straight on
+    def __init__(self, hardware, users):
+        # allocated first so the grant only moves once the registers below have settled
+        self.passing = hardware.bit()
+        self.hardware = hardware
+        self.grants = hardware.const([i == 0 for i in range(users)])
+        self.next_grants = hardware.alloc(users)
+        self.used = hardware.alloc(users)
+        self.busy = [FalseBool(hardware) for _ in range(users)]
+        self.skip = [FalseBool(hardware) for _ in range(users)]
+        self.stop_whens = []
+        hardware.register_finisher(self.finish)
+
+    def request(self, user, busy, skip=None):
+        self.busy[user] = busy
+        if skip is not None:
+            self.skip[user] = skip
+
+    def stop(self, when):
+        # the grant stays where it is while when holds
+        self.stop_whens.append(when)
+
+    def finish(self):
+        for grant, used, busy in zip(self.grants, self.used, self.busy):
+            used.if_(grant & busy)
+            used.not_if(~grant)
+        done = Bool.or_(*(
+            grant & ((used & ~busy) | skip)
+            for grant, used, busy, skip in zip(self.grants, self.used, self.busy, self.skip)
+        ))
+        if self.stop_whens:
+            done = done & ~Bool.or_(*self.stop_whens)
+
+        # the next grants are worked out while not passing, then copied over while passing
+        moved = self.grants == self.next_grants
+        self.next_grants.assign(self.grants << 1, ~self.passing)
+        self.grants.assign(self.next_grants, self.passing)
+        self.passing.if_(done & ~moved)
+        self.passing.not_if(moved)
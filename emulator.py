@@ -0,0 +1,112 @@
+from parser import COMMANDS
+
+OP_NAMES = {code: name for name, code in COMMANDS.items()}
+
+
+class EmulatorError(RuntimeError):
+    pass
+
+
+class Emulator:
+    def __init__(self, starting_memory, memory_size=64, bit_width=8):
+        if len(starting_memory) > memory_size:
+            raise ValueError("Not enough memory for the given program")
+        self.memory = list(starting_memory) + [0] * (memory_size - len(starting_memory))
+        self.bit_width = bit_width
+        self.mask = (1 << bit_width) - 1
+        self.instruction_pointer = 0
+        self.index = 0
+        self.halted = False
+        self.reads = []
+        self.writes = []
+
+    @property
+    def accumulator(self):
+        return self.memory[0]
+
+    def read(self, address):
+        if address >= len(self.memory):
+            raise EmulatorError(f"read from address {address} outside of memory")
+        self.reads.append(address)
+        return self.memory[address]
+
+    def write(self, address, value):
+        if address >= len(self.memory):
+            raise EmulatorError(f"write to address {address} outside of memory")
+        self.writes.append(address)
+        self.memory[address] = value & self.mask
+
+    def fetch(self, ip):
+        # the hardware rotates the instruction pointer left by one to get the op code's address
+        address = ((ip << 1) | (ip >> (self.bit_width - 1))) & self.mask
+        if address + 1 >= len(self.memory):
+            raise EmulatorError(f"instruction fetch from address {address} outside of memory")
+        return self.memory[address], self.memory[address + 1]
+
+    def step(self):
+        if self.halted:
+            raise EmulatorError("the program has already exited")
+        self.reads = []
+        self.writes = []
+        self.instruction_pointer = (self.instruction_pointer + 1) & self.mask
+        line = self.instruction_pointer - 1
+        op_code, op_address = self.fetch(self.instruction_pointer)
+        ref_address = op_address | self.index
+
+        if op_code == 0:
+            self.halted = True
+        elif op_code == 1:
+            self.write(0, self.read(ref_address))
+        elif op_code == 2:
+            self.write(ref_address, self.accumulator)
+        elif op_code == 3:
+            self.write(0, self.accumulator + self.read(ref_address))
+        elif op_code == 4:
+            loaded = self.read(ref_address)
+            self.write(ref_address, self.accumulator)
+            self.write(0, loaded)
+        elif op_code == 5:
+            self.write(0, self.accumulator * self.read(ref_address))
+        elif op_code == 6:
+            self.write(0, ~self.accumulator)
+        elif op_code == 7:
+            self.instruction_pointer = op_address
+        elif op_code == 8:
+            if self.read(ref_address) != 0:
+                self.instruction_pointer = (self.instruction_pointer + 1) & self.mask
+        elif op_code == 9:
+            self.instruction_pointer = self.read(ref_address)
+        elif op_code == 10:
+            self.index = self.read(op_address)
+        elif op_code == 11:
+            self.write(0, int(self.accumulator == self.read(ref_address)))
+        elif op_code == 12:
+            self.write(0, int(self.accumulator >= self.read(ref_address)))
+        else:
+            raise EmulatorError(f"unknown op code {op_code} on line {line}")
+
+        return line, op_code
+
+    def run(self, max_steps=100000):
+        steps = 0
+        while not self.halted:
+            if steps >= max_steps:
+                raise EmulatorError(f"the program did not exit within {max_steps} instructions")
+            self.step()
+            steps += 1
+        return steps
+
+    def fast_forward(self, steps=None, line=None, max_steps=100000):
+        # runs until steps instructions are done or the next one is on line, stopping before EXIT
+        # so the program is left to halt itself
+        done = 0
+        while steps is None or done < steps:
+            if line is not None and self.instruction_pointer == line:
+                break
+            if self.fetch((self.instruction_pointer + 1) & self.mask)[0] == 0:
+                break
+            if done >= max_steps:
+                raise EmulatorError(f"the program did not reach the snapshot within {max_steps} instructions")
+            self.step()
+            done += 1
+        return done
@@ -0,0 +1,357 @@
+import sys
+
+from netlist import Netlist, TRUE, BIT, AND, OR
+
+FALSE_NODE, TRUE_NODE = 0, 1
+
+
+class EquivalenceError(ValueError):
+    pass
+
+
+class BDD:
+    # reduced ordered binary decision diagrams sharing one node table, so two functions are equal
+    # exactly when they are the same node. variables are ordered by when they are first used, which
+    # keeps a mux like the memory read (section i and marker i next to each other) small
+    def __init__(self):
+        # (level, low, high), the terminals sort after every variable
+        self.nodes = [(float("inf"), None, None), (float("inf"), None, None)]
+        self.unique = {}
+        self.ite_cache = {}
+        self.levels = {}
+        self.vars = []
+
+    def node(self, level, low, high):
+        if low == high:
+            return low
+        key = (level, low, high)
+        if key not in self.unique:
+            self.unique[key] = len(self.nodes)
+            self.nodes.append(key)
+        return self.unique[key]
+
+    def var(self, var):
+        if var not in self.levels:
+            self.levels[var] = len(self.vars)
+            self.vars.append(var)
+        return self.node(self.levels[var], FALSE_NODE, TRUE_NODE)
+
+    def cofactors(self, f, level):
+        f_level, low, high = self.nodes[f]
+        if f_level != level:
+            return f, f
+        return low, high
+
+    def ite(self, f, g, h):
+        if f == TRUE_NODE:
+            return g
+        if f == FALSE_NODE:
+            return h
+        if g == h:
+            return g
+        if g == TRUE_NODE and h == FALSE_NODE:
+            return f
+        key = (f, g, h)
+        if key not in self.ite_cache:
+            level = min(self.nodes[f][0], self.nodes[g][0], self.nodes[h][0])
+            f_low, f_high = self.cofactors(f, level)
+            g_low, g_high = self.cofactors(g, level)
+            h_low, h_high = self.cofactors(h, level)
+            self.ite_cache[key] = self.node(
+                level, self.ite(f_low, g_low, h_low), self.ite(f_high, g_high, h_high)
+            )
+        return self.ite_cache[key]
+
+    def not_(self, f):
+        return self.ite(f, FALSE_NODE, TRUE_NODE)
+
+    def and_(self, f, g):
+        return self.ite(f, g, FALSE_NODE)
+
+    def or_(self, f, g):
+        return self.ite(f, TRUE_NODE, g)
+
+    def xor(self, f, g):
+        return self.ite(f, self.not_(g), g)
+
+    def satisfy(self, f):
+        # one assignment making f true, variables left out can be anything
+        if f == FALSE_NODE:
+            return None
+        assignment = {}
+        while f != TRUE_NODE:
+            level, low, high = self.nodes[f]
+            if high != FALSE_NODE:
+                assignment[self.vars[level]] = True
+                f = high
+            else:
+                assignment[self.vars[level]] = False
+                f = low
+        return assignment
+
+    def support(self, f):
+        # the variables f depends on
+        found = set()
+        seen = set()
+        pending = [f]
+        while pending:
+            f = pending.pop()
+            if f in (FALSE_NODE, TRUE_NODE) or f in seen:
+                continue
+            seen.add(f)
+            level, low, high = self.nodes[f]
+            found.add(self.vars[level])
+            pending += [low, high]
+        return found
+
+    def evaluate(self, f, state):
+        while f not in (FALSE_NODE, TRUE_NODE):
+            level, low, high = self.nodes[f]
+            f = high if state.get(self.vars[level], False) else low
+        return f == TRUE_NODE
+
+
+class Counterexample:
+    def __init__(self, bit, state, first, second):
+        self.bit = bit
+        # the bits the difference depends on, every other bit can be anything
+        self.state = state
+        # the value each design switches the bit to in that state
+        self.first = first
+        self.second = second
+
+
+def bit_label(netlist, bit):
+    for (start, end), label in netlist.labels:
+        if start <= bit <= end:
+            return f"{label}[{bit - start}]"
+    return None
+
+
+def bit_name(netlist, bit):
+    return bit_label(netlist, bit) or f"bit {bit}"
+
+
+def rules_by_bit(netlist):
+    rules = [[] for _ in netlist.initial]
+    for id_, value, node in netlist.rules:
+        rules[id_].append((value, node))
+    return rules
+
+
+def read_bits(netlist, rules, bit):
+    found = set()
+    seen = set()
+    pending = [node for _, node in rules[bit] if node is not None]
+    while pending:
+        node = pending.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        kind, arg = netlist.nodes[node]
+        if kind == BIT:
+            found.add(arg)
+        elif kind in (AND, OR):
+            pending.extend(arg)
+        elif kind != TRUE:
+            pending.append(arg)
+    return found
+
+
+def radio_states(bdd, f, groups):
+    # f limited to the states the browser allows, at most one button checked in each group f reads
+    support = bdd.support(f)
+    for start, end in groups:
+        bits = range(start, end + 1)
+        if support.isdisjoint(bits):
+            continue
+        none_checked = TRUE_NODE
+        one_checked = FALSE_NODE
+        for bit in reversed(bits):
+            var = bdd.var(bit)
+            one_checked = bdd.ite(var, none_checked, one_checked)
+            none_checked = bdd.and_(bdd.not_(var), none_checked)
+        f = bdd.and_(f, bdd.or_(none_checked, one_checked))
+    return f
+
+
+def inlined_bits(netlist, rules):
+    # unlabeled bits that are never set and cleared at once, like staged expressions and carries. once
+    # the design settles such a bit holds what its rules say whenever one of them applies, so it can be
+    # replaced by that everywhere it's read. a bit is only looked at once the bits it reads are decided
+    labeled = set()
+    for (start, end), _ in netlist.labels:
+        labeled.update(range(start, end + 1))
+    for start, end in netlist.radio_groups:
+        labeled.update(range(start, end + 1))
+    candidates = set(range(len(netlist.initial))) - labeled
+    reads = {bit: read_bits(netlist, rules, bit) & candidates for bit in candidates}
+
+    # one set of diagrams for all of them, a bit's rules are mostly made of what the bits it reads were
+    bdd = BDD()
+    decided = set()
+    inlined = set()
+    while decided != candidates:
+        ready = [bit for bit in sorted(candidates - decided) if reads[bit] <= decided]
+        if not ready:
+            # the rest read each other in a loop, keeping the first one breaks it
+            decided.add(min(candidates - decided))
+            continue
+        for bit in ready:
+            decided.add(bit)
+            sets, clears = next_switches(netlist, rules, bit, bdd, inlined, lambda other: other)
+            if radio_states(bdd, bdd.and_(sets, clears), netlist.radio_groups) == FALSE_NODE:
+                inlined.add(bit)
+    return inlined
+
+
+def next_switches(netlist, rules, bit, bdd, inlined, rename):
+    # when the bit is set and when it's cleared, as functions of the bits the design keeps
+    converted = {}
+    settled = {}
+
+    def convert(node):
+        if node not in converted:
+            kind, arg = netlist.nodes[node]
+            if kind == TRUE:
+                result = TRUE_NODE
+            elif kind == BIT:
+                result = settle(arg) if arg in inlined else bdd.var(rename(arg))
+            elif kind == AND:
+                result = TRUE_NODE
+                for child in arg:
+                    result = bdd.and_(result, convert(child))
+            elif kind == OR:
+                result = FALSE_NODE
+                for child in arg:
+                    result = bdd.or_(result, convert(child))
+            else:
+                result = bdd.not_(convert(arg))
+            converted[node] = result
+        return converted[node]
+
+    def settle(other):
+        if other not in settled:
+            sets, clears = switch_conditions(other)
+            settled[other] = bdd.ite(bdd.or_(sets, clears), sets, bdd.var(rename(other)))
+        return settled[other]
+
+    def switch_conditions(other):
+        sets = FALSE_NODE
+        clears = FALSE_NODE
+        for value, node in rules[other]:
+            when = TRUE_NODE if node is None else convert(node)
+            if value:
+                sets = bdd.or_(sets, when)
+            else:
+                clears = bdd.or_(clears, when)
+        return sets, clears
+
+    return switch_conditions(bit)
+
+
+def next_state(netlist, rules, inlined, bit, bdd, rename):
+    # the value the bit is switched to from any settled state, as a function of the current bits
+    sets, clears = next_switches(netlist, rules, bit, bdd, inlined, rename)
+    return bdd.ite(bdd.var(rename(bit)), bdd.not_(clears), sets)
+
+
+def kept_bits(netlist, rules, inlined):
+    # every bit that isn't inlined, and the inlined bits something is still read from when their rules
+    # don't apply, which makes them state after all
+    kept = {bit for bit in range(len(netlist.initial)) if bit not in inlined}
+    pending = sorted(kept)
+    while pending:
+        bdd = BDD()
+        for var in bdd.support(next_state(netlist, rules, inlined, pending.pop(), bdd, lambda other: other)):
+            if var not in kept:
+                kept.add(var)
+                pending.append(var)
+    return sorted(kept)
+
+
+def check(first, second, mapping=None):
+    # proves that both netlists switch every bit they keep the same way from every settled state the
+    # browser allows, after inlining staged bits. mapping takes first's kept bit ids to second's, by
+    # default they're matched in order. returns a counterexample for each bit that differs
+    first_rules = rules_by_bit(first)
+    second_rules = rules_by_bit(second)
+    first_inlined = inlined_bits(first, first_rules)
+    second_inlined = inlined_bits(second, second_rules)
+    first_kept = kept_bits(first, first_rules, first_inlined)
+    second_kept = kept_bits(second, second_rules, second_inlined)
+    if mapping is None:
+        if len(first_kept) != len(second_kept):
+            raise EquivalenceError(
+                f"the designs keep {len(first_kept)} and {len(second_kept)} bits once staged ones are inlined, "
+                "a mapping is needed"
+            )
+        mapping = dict(zip(first_kept, second_kept))
+        for bit, renamed in mapping.items():
+            if bit_label(first, bit) != bit_label(second, renamed):
+                raise EquivalenceError(
+                    f"{bit_name(first, bit)} lines up with {bit_name(second, renamed)}, a mapping is needed"
+                )
+    elif sorted(mapping.get(bit, -1) for bit in first_kept) != second_kept:
+        raise EquivalenceError("the mapping has to match every kept bit of one design to a bit of the other")
+
+    def rename(bit):
+        # inlined bits are never left in a kept bit's function, they only need a name of their own
+        return mapping.get(bit, ("inlined", bit))
+
+    initial_differs = [bit for bit in first_kept if first.initial[bit] != second.initial[rename(bit)]]
+    if initial_differs:
+        raise EquivalenceError(f"the designs start differently at {bit_name(first, initial_differs[0])}")
+    first_groups = sorted(tuple(sorted(rename(bit) for bit in range(start, end + 1)))
+                          for start, end in first.radio_groups)
+    second_groups = sorted(tuple(range(start, end + 1)) for start, end in second.radio_groups)
+    if first_groups != second_groups:
+        raise EquivalenceError("the designs have different radio button groups")
+
+    counterexamples = []
+    for bit in first_kept:
+        # each bit gets its own diagrams so the variable order only has to suit that bit's rules
+        bdd = BDD()
+        renamed = rename(bit)
+        first_next = next_state(first, first_rules, first_inlined, bit, bdd, rename)
+        second_next = next_state(second, second_rules, second_inlined, renamed, bdd, lambda other: other)
+        differs = radio_states(bdd, bdd.xor(first_next, second_next), second.radio_groups)
+        if differs == FALSE_NODE:
+            continue
+        state = bdd.satisfy(differs)
+        counterexamples.append(Counterexample(
+            renamed, state, bdd.evaluate(first_next, state), bdd.evaluate(second_next, state)
+        ))
+    return counterexamples
+
+
+def report(netlist, counterexamples, limit=10):
+    if not counterexamples:
+        print("the designs are equivalent")
+        return
+    print(f"{len(counterexamples)} bits switch differently")
+    for counterexample in counterexamples[:limit]:
+        print(f"{bit_name(netlist, counterexample.bit)}: first switches it to {int(counterexample.first)}, "
+              f"second to {int(counterexample.second)} when")
+        for bit, value in sorted(counterexample.state.items()):
+            print(f"    {bit_name(netlist, bit)} = {int(value)}")
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("usage: python equivalence.py <first.netlist> <second.netlist>")
+        sys.exit(1)
+    first = Netlist.load(sys.argv[1])
+    second = Netlist.load(sys.argv[2])
+    try:
+        counterexamples = check(first, second)
+    except EquivalenceError as error:
+        print(error)
+        sys.exit(1)
+    report(second, counterexamples)
+    if counterexamples:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
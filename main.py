@@ -1,5 +1,10 @@
 import parser
-from blocks import Hardware, BitChain, OneHot, MemNumber, Array, Counter, Bool
+from emulator import Emulator
+from blocks import (
+    Hardware, BitChain, OneHot, Number, MemNumber, Array, SplitMemory, Counter, Bool, TrueBool,
+    SequentialMultiplier, RoundRobin
+)
+from netlist import Netlist
 
 """
 INSTRUCTION SET:
@@ -19,6 +24,8 @@ INSTRUCTION SET:
 0x05 MULT: multiplies the accumulator by the specified value
     A. load from storage and compute multiplication, storing result to intermediate
     B. load from intermediate to accumulator
+    (with the sequential multiplier, A loads the operands and B steps it until it finishes, then stores the
+    product to the accumulator)
 0x06 INV: inverts the accumulator's value
     A. store the accumulator to intermediate
     B. store intermediate inverted to the accumulator
@@ -36,115 +43,258 @@ into the accumulator
     A. store whether the accumulator equals the specified value in intermediate
     B. set the accumulator to the value stored in intermediate
 0x0C GTEQ: determines if the accumulator's value is greater than or equal to the specified value
-    A. store whether the accumulator is greater or equal to the specified value in intermediate
+    A. subtract the specified value from the accumulator, storing whether nothing was borrowed in intermediate
     B. set the accumulator to the value stored in intermediate
 
+Phases 0 and 1 fetch the instruction, the steps A, B and C run in phases 2, 3 and 4. Once an
+instruction's last phase is done the phase chain restarts, so shorter instructions take fewer ticks.
+
+With several cores each one has its own registers and phase chain, and they take turns running an
+instruction on the shared memory. A core waits in phase 0 until it has the turn, and EXIT stops only
+its own core, the computer freezes once every core has exited.
+
 SPECIAL MEMORY POSITIONS:
 0x00: the accumulator
 0x01: reserved for future use
+(with several cores, every core has its own copy of these)
 """
 
-
-def main():
-    memory_size = 64
-    bit_width = 8
-
-    with open("triangle2.cca") as file:
-        code = file.read()
-    starting_memory = parser.parse(code)
-    if len(starting_memory) >= memory_size:
+# the last phase each op code uses, indexed by op code
+last_phases = [2, 3, 2, 3, 4, 3, 3, 2, 3, 3, 2, 3, 3]
+
+
+class Core:
+    # the registers and instruction logic of one CPU, the memory is passed in so several cores can share it
+    def __init__(self, hardware, phase, bit_width=8, multiplier="array", index=0, alu_slice_width=1):
+        self.hardware = hardware
+        self.phase = phase
+        self.bit_width = bit_width
+        self.multiplier = multiplier
+        self.op_code = OneHot(hardware, 13)
+        self.op_address = MemNumber(hardware, bit_width)
+        self.index = MemNumber(hardware, bit_width, index)
+        self.intermediate = MemNumber(hardware, bit_width)
+        self.alu_slice_width = alu_slice_width
+        # the ADD and GTEQ adders share their carries with the array multiplier, they are never used at once
+        if multiplier == "array":
+            self.carries = hardware.alloc(Number.mult_carry_count(bit_width))
+        elif multiplier == "sequential":
+            self.sequential_multiplier = SequentialMultiplier(hardware, bit_width)
+            self.carries = hardware.alloc(Number.full_add_carry_count(bit_width, alu_slice_width))
+        else:
+            raise ValueError(f"Unknown multiplier {multiplier!r}")
+
+    def connect(self, memory, instruction_pointer, halted):
+        phase = self.phase
+        op_code = self.op_code
+        op_address = self.op_address
+        index = self.index
+        intermediate = self.intermediate
+        bit_width = self.bit_width
+        self.instruction_pointer = instruction_pointer
+        self.halted = halted
+        self.accumulator = accumulator = MemNumber.from_(self.hardware, memory[0])
+
+        phase_0 = phase.exactly(0)
+        instruction_pointer.count(phase_0)
+
+        phase_1 = phase.exactly(1)
+        op_code_idx = instruction_pointer << 1
+        op_code.set_source(memory.get(op_code_idx, phase_1, 0), phase_1)
+        op_code_address = op_code_idx | 1
+        op_address.assign(memory.get(op_code_address, phase_1, 1), phase_1)
+
+        phase_2 = phase.exactly(2)
+        phase_3 = phase.exactly(3)
+        phase_4 = phase.exactly(4)
+
+        for code, last_phase in enumerate(last_phases):
+            phase.stop_after(last_phase, op_code[code])
+
+        ref_address = op_address | index
+
+        load_op_codes = [1, 3, 4, 5, 8, 9, 11, 12]
+        loaded = memory.get(ref_address, phase_2 & Bool.or_(*(op_code[code] for code in load_op_codes)))
+
+        halted.if_(phase_2 & op_code[0])
+
+        accumulator.assign(loaded, phase_3 & op_code[1])
+
+        memory.set(ref_address, accumulator, phase_2 & op_code[2])
+
+        total, _ = accumulator.full_add(
+            loaded, None, phase_2 & op_code[3], list(self.carries), self.alu_slice_width
+        )
+        intermediate.assign(total, phase_2 & op_code[3])
+        accumulator.assign(intermediate, phase_3 & op_code[3])
+
+        intermediate.assign(loaded, phase_2 & op_code[4])
+        memory.set(ref_address, accumulator, phase_3 & op_code[4])
+        accumulator.assign(intermediate, phase_4 & op_code[4])
+
+        if self.multiplier == "array":
+            intermediate.assign(accumulator.mult(loaded, phase_2 & op_code[5], list(self.carries)), phase_2 & op_code[5])
+            accumulator.assign(intermediate, phase_3 & op_code[5])
+        else:
+            product, done = self.sequential_multiplier.multiply(
+                accumulator, loaded, phase_2 & op_code[5], phase_3 & op_code[5]
+            )
+            accumulator.assign(product, done)
+
+        intermediate.assign(accumulator, phase_2 & op_code[6])
+        accumulator.assign(~intermediate, phase_3 & op_code[6])
+
+        instruction_pointer.assign(op_address, phase_2 & op_code[7])
+
+        instruction_pointer.count((loaded != 0) & phase_3 & op_code[8])
+
+        instruction_pointer.assign(loaded, phase_3 & op_code[9])
+
+        index.assign(memory.get(op_address, phase_2 & op_code[10]), phase_2 & op_code[10])
+
+        intermediate[0].iff_when(accumulator == loaded, phase_2 & op_code[11])
+        accumulator[0].iff_when(intermediate[0], phase_3 & op_code[11])
+
+        # adding the inverted value and 1 subtracts it, and the carry out is set when nothing was borrowed
+        _, no_borrow = accumulator.full_add(
+            ~loaded, TrueBool(self.hardware), phase_2 & op_code[12], list(self.carries), self.alu_slice_width
+        )
+        intermediate[0].iff_when(no_borrow, phase_2 & op_code[12])
+        accumulator[0].iff_when(intermediate[0], phase_3 & op_code[12])
+
+        bool_op_codes = [11, 12]
+        for i in range(1, bit_width):
+            accumulator[i].not_if(phase_3 & Bool.or_(*(op_code[code] for code in bool_op_codes)))
+
+    def label(self, prefix=""):
+        self.phase.label(f"{prefix}phase")
+        self.instruction_pointer.label(f"{prefix}instruction pointer")
+        self.op_code.label(f"{prefix}op code")
+        self.op_address.label(f"{prefix}op address")
+        self.accumulator.label(f"{prefix}accumulator")
+        self.intermediate.label(f"{prefix}intermediate")
+        self.index.label(f"{prefix}index")
+
+
+def build(starting_memory, memory_size=64, bit_width=8, max_selector_depth=None, max_selector_length=None,
+          multiplier=None, entry_points=(0,), private_size=2, radio_one_hot=True, indexes=None,
+          alu_slice_width=1):
+    # expressions nested deeper than the max selector depth, or making rules longer than the max selector length,
+    # are staged into their own bits
+    # multiplier is "array" for the one phase Number.mult or "sequential" for the O(width) SequentialMultiplier,
+    # by default the array multiplier is only used up to 8 bits since it grows with width^2
+    # a core is built for each entry point (the line it starts on). with more than one, the cores take turns
+    # running an instruction on the shared memory, and each has its own copy of the first private_size
+    # addresses (the accumulator and 0x01)
+    # radio_one_hot makes the op code and the memory index markers radio buttons instead of checkboxes
+    # indexes are the values each core's index starts with, 0 by default
+    # alu_slice_width is how many bits the ADD and GTEQ adders work out at once instead of staging their carries
+    if len(starting_memory) > memory_size:
         raise ValueError("Not enough memory for the given program")
+    if memory_size > 1 << bit_width:
+        raise ValueError(f"{bit_width} bit addresses can't reach {memory_size} memory sections")
+    if multiplier is None:
+        multiplier = "array" if bit_width <= 8 else "sequential"
+    if indexes is None:
+        indexes = [0] * len(entry_points)
+
+    hardware = Hardware(max_selector_depth, max_selector_length, radio_one_hot)
+
+    # the phase chains and the arbiter come first so they only move once the cores have settled
+    phases = [BitChain(hardware, 5) for _ in entry_points]
+    arbiter = RoundRobin(hardware, len(entry_points)) if len(entry_points) > 1 else None
+    cores = [
+        Core(hardware, phase, bit_width, multiplier, index, alu_slice_width)
+        for phase, index in zip(phases, indexes)
+    ]
+    memory = Array(hardware, memory_size, bit_width, bit_width, starting_memory, read_ports=2)
+
+    if arbiter is None:
+        instruction_pointer = Counter(hardware, bit_width, entry_points[0])
+        freezer_bit = hardware.bit()
+        freezer_bit.set(False)
+        cores[0].connect(memory, instruction_pointer, freezer_bit)
+        cores[0].label()
+    else:
+        for i, (core, entry_point) in enumerate(zip(cores, entry_points)):
+            private = Array(hardware, private_size, bit_width, bit_width, starting_memory[:private_size], read_ports=2)
+            instruction_pointer = Counter(hardware, bit_width, entry_point)
+            halted = hardware.bit()
+            core.connect(SplitMemory(private, memory), instruction_pointer, halted)
+            core.phase.wait(~arbiter.grants[i] | halted)
+            arbiter.request(i, core.phase.bits[1], halted)
+            core.label(f"core {i} ")
+            halted.label(f"core {i} halted")
+        freezer_bit = hardware.bit()
+        freezer_bit.set(False)
+        all_halted = Bool.and_(*(core.halted for core in cores))
+        freezer_bit.if_(all_halted)
+        arbiter.stop(all_halted)
+
+    memory.index.label("mem write index")
+    memory.in_.label("mem in")
+    for i, port in enumerate(memory.ports):
+        port.index.label(f"mem read index {i}")
+        port.out.label(f"mem out {i}")
+    freezer_bit.label("freezer")
+    # skip the accumulator and 0x01 which is reserved, or the addresses each core has its own copy of
+    first_section = 2 if arbiter is None else private_size
+    for i, section in enumerate(memory.mem_sections[first_section:], first_section):
+        section.label(f"mem section {i}")
 
-    hardware = Hardware()
-
-    phase = BitChain(hardware, 6)
-    op_code = OneHot(hardware, 13)
-    op_address = MemNumber(hardware, bit_width)
-    index = MemNumber(hardware, bit_width)
-    intermediate = MemNumber(hardware, bit_width)
-    carries = hardware.alloc(2*bit_width*bit_width-3*bit_width+2)
-    memory = Array(hardware, memory_size, bit_width, bit_width, starting_memory)
-    instruction_pointer = Counter(hardware, bit_width)
-    freezer_bit = hardware.bit()
-
-    freezer_bit.set(False)
-    accumulator = MemNumber.from_(hardware, memory[0])
-
-    phase_0 = phase.exactly(0)
-    instruction_pointer.count(phase_0)
-
-    phase_1 = phase.exactly(1)
-    op_code_idx = instruction_pointer << 1
-    op_code.set_source(memory.get(op_code_idx, phase_1), phase_1)
-
-    phase_2 = phase.exactly(2)
-    op_code_address = op_code_idx | 1
-    op_address.assign(memory.get(op_code_address, phase_2), phase_2)
-
-    phase_3 = phase.exactly(3)
-    phase_4 = phase.exactly(4)
-    phase_5 = phase.exactly(5)
-
-    ref_address = op_address | index
-
-    load_op_codes = [1, 3, 4, 5, 8, 9, 11, 12]
-    loaded = memory.get(ref_address, phase_3 & Bool.or_(*(op_code[code] for code in load_op_codes)))
-
-    freezer_bit.if_(phase_3 & op_code[0])
-
-    accumulator.assign(loaded, phase_4 & op_code[1])
-
-    memory.set(ref_address, accumulator, phase_3 & op_code[2])
-
-    intermediate.assign(accumulator.add(loaded, phase_3 & op_code[3], list(carries)), phase_3 & op_code[3])
-    accumulator.assign(intermediate, phase_4 & op_code[3])
-
-    intermediate.assign(loaded, phase_3 & op_code[4])
-    memory.set(ref_address, accumulator, phase_4 & op_code[4])
-    accumulator.assign(intermediate, phase_5 & op_code[4])
-
-    intermediate.assign(accumulator.mult(loaded, phase_3 & op_code[5], list(carries)), phase_3 & op_code[5])
-    accumulator.assign(intermediate, phase_4 & op_code[5])
-
-    intermediate.assign(accumulator, phase_3 & op_code[6])
-    accumulator.assign(~intermediate, phase_4 & op_code[6])
-
-    instruction_pointer.assign(op_address, phase_3 & op_code[7])
-
-    instruction_pointer.count((loaded != 0) & phase_4 & op_code[8])
-
-    instruction_pointer.assign(loaded, phase_4 & op_code[9])
-
-    index.assign(memory.get(op_address, phase_3 & op_code[10]), phase_3 & op_code[10])
+    hardware.finish()
+    return hardware
 
-    intermediate[0].iff_when(accumulator == loaded, phase_3 & op_code[11])
-    accumulator[0].iff_when(intermediate[0], phase_4 & op_code[11])
 
-    gt_or_eq = accumulator.greater_or_equal(loaded, phase_3 & op_code[12], list(carries))
-    intermediate[0].iff_when(gt_or_eq, phase_3 & op_code[12])
-    accumulator[0].iff_when(intermediate[0], phase_4 & op_code[12])
+def fast_forward(starting_memory, memory_size=64, bit_width=8, steps=None, line=None):
+    # runs the program ahead of time for steps instructions or until the next one is on line (from 0), and
+    # returns the memory, instruction pointer and index to build the computer with so the page starts
+    # there. a snapshot is always between instructions, where the phase chain is back to 0 anyway
+    emulator = Emulator(starting_memory, memory_size, bit_width)
+    emulator.fast_forward(steps, line)
+    memory = list(emulator.memory)
+    while len(memory) > len(starting_memory) and memory[-1] == 0:
+        memory.pop()
+    return memory, emulator.instruction_pointer, emulator.index
 
-    bool_op_codes = [11, 12]
-    for i in range(1, bit_width):
-        accumulator[i].not_if(phase_4 & Bool.or_(*(op_code[code] for code in bool_op_codes)))
 
-    phase.label("phase")
-    instruction_pointer.label("instruction pointer")
-    op_code.label("op code")
-    op_address.label("op address")
-    accumulator.label("accumulator")
-    memory.index.label("mem index")
-    memory.out.label("mem in")
-    memory.out.label("mem out")
-    intermediate.label("intermediate")
-    freezer_bit.label("freezer")
-    index.label("index")
-    # [2:] to remove the accumulator and 0x01 which is reserved
-    for i, section in enumerate(memory.mem_sections[2:]):
-        section.label(f"mem section {i+2}")
-
-    hardware.finish()
-    hardware.output(r"D:\Programming\Programs\cssputer\index.html", r"D:\Programming\Programs\cssputer\puter.css")
+def main():
+    with open("triangle2.cca") as file:
+        code = file.read()
+    # the line each core starts on, more entry points run several programs from the image side by side
+    entry_points = [0]
+    # the width of every word, address and register, with 16 bits more than 256 memory sections can be used
+    bit_width = 8
+    # run this many instructions, or up to this line of the optimized program (numbered from 1 like GOTO's
+    # operand), before building so the page starts from there instead of ticking through the setup. only
+    # with one core
+    fast_forward_steps = None
+    fast_forward_line = None
+    # the optimizer only knows about the program starting on line 0
+    starting_memory = parser.parse(code, optimize=len(entry_points) == 1, bit_width=bit_width)
+
+    indexes = None
+    if len(entry_points) == 1 and (fast_forward_steps is not None or fast_forward_line is not None):
+        starting_memory, entry_point, index = fast_forward(
+            starting_memory, bit_width=bit_width, steps=fast_forward_steps,
+            line=None if fast_forward_line is None else fast_forward_line - 1
+        )
+        entry_points = [entry_point]
+        indexes = [index]
+
+    hardware = build(starting_memory, bit_width=bit_width, entry_points=entry_points, indexes=indexes)
+    if hardware.staged:
+        # how many ticks that adds depends on how often they change, benchmark.py counts them per instruction
+        print(f"staged {len(hardware.staged)} expressions, each costs a tick whenever its value changes")
+    if hardware.over_budget:
+        print(f"{hardware.over_budget} rules can't be split any further and are still over the selector budget")
+    # the build fails if the html and css add up to more bytes than this
+    max_output_bytes = None
+    hardware.output(
+        r"D:\Programming\Programs\cssputer\index.html", r"D:\Programming\Programs\cssputer\puter.css",
+        max_output_bytes
+    )
+    Netlist.from_hardware(hardware).save(r"D:\Programming\Programs\cssputer\puter.netlist")
 
 
 if __name__ == '__main__':
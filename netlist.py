@@ -0,0 +1,271 @@
+import sys
+import zlib
+
+from blocks import Hardware
+
+MAGIC = b"CSSN\x02"
+
+TRUE, BIT, AND, OR, NOT = range(5)
+
+
+class NetlistFormatError(ValueError):
+    pass
+
+
+class TemplateParser:
+    # parses the %id%/$/:is()/:not() templates CSSBool builds back into expression nodes
+    def __init__(self, netlist, css):
+        self.netlist = netlist
+        self.css = css
+        self.pos = 0
+
+    def parse(self):
+        node = self.selector_list()
+        if self.pos != len(self.css):
+            raise NetlistFormatError(f"unexpected {self.css[self.pos:self.pos + 10]!r} in selector")
+        return node
+
+    def selector_list(self):
+        items = [self.compound()]
+        while self.pos < len(self.css) and self.css[self.pos] == ",":
+            self.pos += 1
+            items.append(self.compound())
+        if len(items) == 1:
+            return items[0]
+        return self.netlist.node(OR, tuple(items))
+
+    def compound(self):
+        css = self.css
+        items = []
+        wrapped = False
+        while self.pos < len(css) and css[self.pos] not in ",)":
+            if css[self.pos] == "%":
+                end = css.index("%", self.pos + 1)
+                items.append(self.netlist.node(BIT, int(css[self.pos + 1:end])))
+                self.pos = end + 1
+            elif css[self.pos] == "$":
+                self.pos += 1
+            elif css.startswith(":is(", self.pos):
+                self.pos += 4
+                items.append(self.selector_list())
+                self.close()
+                wrapped = True
+            elif css.startswith(":not(", self.pos):
+                self.pos += 5
+                items.append(self.netlist.node(NOT, self.selector_list()))
+                self.close()
+            else:
+                raise NetlistFormatError(f"unexpected {css[self.pos:self.pos + 10]!r} in selector")
+        if not items:
+            return self.netlist.node(TRUE, None)
+        if len(items) == 1 and not wrapped:
+            return items[0]
+        return self.netlist.node(AND, tuple(items))
+
+    def close(self):
+        if self.pos >= len(self.css) or self.css[self.pos] != ")":
+            raise NetlistFormatError("unclosed parenthesis in selector")
+        self.pos += 1
+
+
+def write_varint(out, num):
+    while True:
+        byte = num & 0x7F
+        num >>= 7
+        if num:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+class Reader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def varint(self):
+        num = 0
+        shift = 0
+        while True:
+            if self.pos >= len(self.data):
+                raise NetlistFormatError("truncated netlist")
+            byte = self.data[self.pos]
+            self.pos += 1
+            num |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return num
+            shift += 7
+
+    def bytes(self, count):
+        if self.pos + count > len(self.data):
+            raise NetlistFormatError("truncated netlist")
+        result = self.data[self.pos:self.pos + count]
+        self.pos += count
+        return result
+
+
+class Netlist:
+    # the elaborated design: initial bit values, debug labels, radio button groups, and the conditions
+    # that switch each bit on or off as an expression graph shared between rules
+    def __init__(self, initial=None, labels=None, radio_groups=None):
+        self.initial = initial or []
+        self.labels = labels or []
+        self.radio_groups = radio_groups or []
+        self.nodes = []
+        self.node_ids = {}
+        # (bit id, value, node index or None for unconditional)
+        self.rules = []
+
+    def node(self, kind, arg):
+        key = (kind, arg)
+        if key not in self.node_ids:
+            self.node_ids[key] = len(self.nodes)
+            self.nodes.append(key)
+        return self.node_ids[key]
+
+    @classmethod
+    def from_hardware(cls, hardware):
+        netlist = cls(list(hardware.initial), list(hardware.labels), list(hardware.radio_groups))
+        parsed = {}
+        for id_, value, css in hardware.rules:
+            node = None
+            if css is not None:
+                if css not in parsed:
+                    parsed[css] = TemplateParser(netlist, css).parse()
+                node = parsed[css]
+            netlist.rules.append((id_, value, node))
+        return netlist
+
+    def templates(self):
+        templates = []
+        for kind, arg in self.nodes:
+            if kind == TRUE:
+                templates.append("")
+            elif kind == BIT:
+                templates.append(f"%{arg}%")
+            elif kind == AND:
+                templates.append("".join(f":is({templates[child]})" for child in arg))
+            elif kind == OR:
+                templates.append(",".join(templates[child] for child in arg))
+            else:
+                templates.append(f"$:not({templates[arg]})")
+        return templates
+
+    def to_hardware(self):
+        hardware = Hardware()
+        groups = {}
+        for group, (start, end) in enumerate(self.radio_groups):
+            for id_ in range(start, end + 1):
+                groups[id_] = group
+        for id_, value in enumerate(self.initial):
+            hardware.bit(value, groups.get(id_))
+        hardware.labels = list(self.labels)
+        hardware.radio_groups = list(self.radio_groups)
+        templates = self.templates()
+        for id_, value, node in self.rules:
+            hardware.add_rule(id_, value, None if node is None else templates[node])
+        return hardware
+
+    def to_bytes(self):
+        out = bytearray()
+        write_varint(out, len(self.initial))
+        packed = bytearray((len(self.initial) + 7) // 8)
+        for i, value in enumerate(self.initial):
+            if value:
+                packed[i // 8] |= 1 << (i % 8)
+        out += packed
+
+        write_varint(out, len(self.labels))
+        for (start, end), name in self.labels:
+            encoded = name.encode()
+            write_varint(out, start)
+            write_varint(out, end)
+            write_varint(out, len(encoded))
+            out += encoded
+
+        write_varint(out, len(self.radio_groups))
+        for start, end in self.radio_groups:
+            write_varint(out, start)
+            write_varint(out, end)
+
+        write_varint(out, len(self.nodes))
+        for kind, arg in self.nodes:
+            out.append(kind)
+            if kind in (BIT, NOT):
+                write_varint(out, arg)
+            elif kind in (AND, OR):
+                write_varint(out, len(arg))
+                for child in arg:
+                    write_varint(out, child)
+
+        write_varint(out, len(self.rules))
+        for id_, value, node in self.rules:
+            write_varint(out, id_)
+            out.append(int(value))
+            write_varint(out, 0 if node is None else node + 1)
+
+        return MAGIC + zlib.compress(bytes(out), 9)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data.startswith(MAGIC):
+            raise NetlistFormatError("not a netlist file")
+        try:
+            reader = Reader(zlib.decompress(data[len(MAGIC):]))
+        except zlib.error:
+            raise NetlistFormatError("corrupt netlist")
+
+        bit_count = reader.varint()
+        packed = reader.bytes((bit_count + 7) // 8)
+        initial = [bool(packed[i // 8] >> (i % 8) & 1) for i in range(bit_count)]
+
+        labels = []
+        for _ in range(reader.varint()):
+            start = reader.varint()
+            end = reader.varint()
+            name = reader.bytes(reader.varint()).decode()
+            labels.append(((start, end), name))
+
+        radio_groups = [(reader.varint(), reader.varint()) for _ in range(reader.varint())]
+
+        netlist = cls(initial, labels, radio_groups)
+        for _ in range(reader.varint()):
+            kind = reader.bytes(1)[0]
+            if kind == TRUE:
+                arg = None
+            elif kind in (BIT, NOT):
+                arg = reader.varint()
+            elif kind in (AND, OR):
+                arg = tuple(reader.varint() for _ in range(reader.varint()))
+            else:
+                raise NetlistFormatError(f"unknown node kind {kind}")
+            netlist.node(kind, arg)
+
+        for _ in range(reader.varint()):
+            id_ = reader.varint()
+            value = bool(reader.bytes(1)[0])
+            node = reader.varint()
+            netlist.rules.append((id_, value, None if node == 0 else node - 1))
+        return netlist
+
+    def save(self, path):
+        with open(path, "wb") as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            return cls.from_bytes(file.read())
+
+
+def main():
+    if len(sys.argv) != 4:
+        print("usage: python netlist.py <design.netlist> <index.html> <puter.css>")
+        sys.exit(1)
+    netlist_loc, html_loc, css_loc = sys.argv[1:]
+    Netlist.load(netlist_loc).to_hardware().output(html_loc, css_loc)
+
+
+if __name__ == '__main__':
+    main()
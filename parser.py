@@ -1,8 +1,176 @@
+COMMANDS = {
+    "EXIT": 0,
+    "LOAD": 1,
+    "STOR": 2,
+    "ADD": 3,
+    "SWAP": 4,
+    "MULT": 5,
+    "INV": 6,
+    "GOTO": 7,
+    "SKIP": 8,
+    "LEAP": 9,
+    "INDX": 10,
+    "EQ": 11,
+    'GTEQ': 12
+}
+
+
 class CCASyntaxError(ValueError):
     pass
 
 
-def parse(text, show_var_locations=True):
+def parse(text, show_var_locations=True, optimize=False, bit_width=8):
+    result, variable_locations = parse_with_locations(text, optimize, bit_width, show_var_locations)
+    if show_var_locations:
+        print(variable_locations)
+    return result
+
+
+def tokenize_code(code_lines):
+    instructions = []
+    for code_line in code_lines:
+        if not code_line:
+            raise CCASyntaxError()
+        cmd, *operand_txts = code_line.split()
+        if cmd not in COMMANDS:
+            raise CCASyntaxError()
+        operand_txt = None
+        if cmd not in ["EXIT", "INV"]:
+            try:
+                operand_txt, = operand_txts
+            except ValueError:
+                raise CCASyntaxError()
+            if cmd in ["GOTO"]:
+                try:
+                    int(operand_txt, 16)
+                except ValueError:
+                    raise CCASyntaxError()
+        instructions.append((cmd, operand_txt))
+    return instructions
+
+
+def jump_targets(instructions):
+    targets = set()
+    skipped = set()
+    for i, (cmd, operand_txt) in enumerate(instructions):
+        if cmd == "GOTO":
+            targets.add(int(operand_txt, 16) - 1)
+        elif cmd == "SKIP":
+            skipped.add(i + 1)
+            targets.add(i + 2)
+    return targets, skipped
+
+
+def thread_gotos(instructions):
+    threaded = list(instructions)
+    for i, (cmd, operand_txt) in enumerate(instructions):
+        if cmd != "GOTO":
+            continue
+        target = int(operand_txt, 16) - 1
+        seen = {i}
+        while 0 <= target < len(instructions) and instructions[target][0] == "GOTO" and target not in seen:
+            seen.add(target)
+            target = int(instructions[target][1], 16) - 1
+        threaded[i] = (cmd, f"{target + 1:X}")
+    return threaded
+
+
+def unreachable_lines(instructions):
+    reachable = set()
+    to_visit = [0]
+    while to_visit:
+        line = to_visit.pop()
+        if line in reachable or not 0 <= line < len(instructions):
+            continue
+        reachable.add(line)
+        cmd, operand_txt = instructions[line]
+        if cmd == "EXIT":
+            continue
+        elif cmd == "GOTO":
+            to_visit.append(int(operand_txt, 16) - 1)
+        elif cmd == "SKIP":
+            to_visit.extend([line + 1, line + 2])
+        else:
+            to_visit.append(line + 1)
+    return set(range(len(instructions))) - reachable
+
+
+def redundant_lines(instructions, zero_names=()):
+    # zero_names start at 0, they only stay 0 if nothing stores to them by name and every store happens
+    # while the index is known to be 0, so none can land on them through the index either
+    zero_names = set(zero_names) - {operand_txt for cmd, operand_txt in instructions if cmd in ["STOR", "SWAP"]}
+    redundant, stores_unindexed = scan_index(instructions, zero_names)
+    if not stores_unindexed:
+        redundant, _ = scan_index(instructions, set())
+    return redundant
+
+
+def scan_index(instructions, zero_names):
+    targets, skipped = jump_targets(instructions)
+    redundant = set()
+    # the variable the index was last loaded from while it still holds the same value, and whether the
+    # index is 0, which it is when the program starts
+    index_source = None
+    index_zero = True
+    stores_unindexed = True
+    for i, (cmd, operand_txt) in enumerate(instructions):
+        if i in targets:
+            index_source = None
+            index_zero = False
+        removable = i not in targets and i not in skipped
+        if cmd == "LOAD" and removable and i > 0 and instructions[i - 1] == ("STOR", operand_txt):
+            redundant.add(i)
+        if cmd == "INDX":
+            if removable and (operand_txt == index_source or (index_zero and operand_txt in zero_names)):
+                redundant.add(i)
+            index_source = operand_txt
+            index_zero = operand_txt in zero_names
+        elif cmd in ["STOR", "SWAP"]:
+            stores_unindexed = stores_unindexed and index_zero
+            index_source = None
+        elif index_source == "A" and cmd not in ["GOTO", "SKIP", "LEAP", "EXIT"]:
+            index_source = None
+    return redundant, stores_unindexed
+
+
+def optimize_code(instructions, zero_names=()):
+    line_map = {i: i for i in range(len(instructions))}
+    instructions = thread_gotos(instructions)
+    # LEAP jumps to a line number stored in data, so lines can't be moved if it is used
+    if any(cmd == "LEAP" for cmd, _ in instructions):
+        return instructions, line_map
+
+    while True:
+        removed = unreachable_lines(instructions) | redundant_lines(instructions, zero_names)
+        if not removed:
+            return instructions, line_map
+        new_lines = {}
+        for i in range(len(instructions)):
+            if i not in removed:
+                new_lines[i] = len(new_lines)
+        kept = []
+        for i, (cmd, operand_txt) in enumerate(instructions):
+            if i in removed:
+                continue
+            if cmd == "GOTO":
+                target = int(operand_txt, 16) - 1
+                operand_txt = f"{new_lines.get(target, target) + 1:X}"
+            kept.append((cmd, operand_txt))
+        instructions = kept
+        line_map = {
+            original: new_lines.get(line)
+            for original, line in line_map.items()
+        }
+
+
+def print_line_map(line_map):
+    print("line map (original -> optimized):")
+    for original, line in line_map.items():
+        print(f"  {original + 1:X} -> {'removed' if line is None else f'{line + 1:X}'}")
+
+
+def parse_with_locations(text, optimize=False, bit_width=8, show_line_map=True):
+    # every instruction takes two words of bit_width bits, the op code and then its operand
     code_lines = []
     data_lines = []
     number_lines = []
@@ -83,7 +251,9 @@ def parse(text, show_var_locations=True):
                 numbers.update(range(previous[-3], previous[-1]+1))
 
     for number in numbers:
-        variables[str(number)] = number % 256
+        variables[str(number)] = number % (1 << bit_width)
+
+    zero_names = {name for name, value in variables.items() if value % (1 << bit_width) == 0}
 
     result = [0, 0]
     # add code placeholder
@@ -115,43 +285,19 @@ def parse(text, show_var_locations=True):
         else:
             result.append(0)
 
-    if show_var_locations:
-        print(variable_locations)
+    instructions = tokenize_code(code_lines)
+    if optimize:
+        instructions, line_map = optimize_code(instructions, zero_names)
+        if show_line_map:
+            print_line_map(line_map)
 
     i = 2
-    for code_line in code_lines:
-        if not code_line:
-            raise CCASyntaxError()
-        cmd, *operand_txts = code_line.split()
-        command_map = {
-            "EXIT": 0,
-            "LOAD": 1,
-            "STOR": 2,
-            "ADD": 3,
-            "SWAP": 4,
-            "MULT": 5,
-            "INV": 6,
-            "GOTO": 7,
-            "SKIP": 8,
-            "LEAP": 9,
-            "INDX": 10,
-            "EQ": 11,
-            'GTEQ': 12
-        }
-        if cmd not in command_map:
-            raise CCASyntaxError()
-        cmd_code = command_map[cmd]
+    for cmd, operand_txt in instructions:
+        cmd_code = COMMANDS[cmd]
         operand = 0
-        if cmd not in ["EXIT", "INV"]:
-            try:
-                operand_txt, = operand_txts
-            except IndexError:
-                raise CCASyntaxError()
+        if operand_txt is not None:
             if cmd in ["GOTO"]:
-                try:
-                    operand = int(operand_txt, 16) - 1
-                except ValueError:
-                    raise CCASyntaxError()
+                operand = int(operand_txt, 16) - 1
             else:
                 if operand_txt not in variable_locations:
                     raise CCASyntaxError()
@@ -160,4 +306,4 @@ def parse(text, show_var_locations=True):
         result[i+1] = operand
         i += 2
 
-    return result
+    return result, variable_locations
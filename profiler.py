@@ -0,0 +1,117 @@
+import sys
+from collections import Counter
+
+import parser
+from emulator import Emulator
+from main import build, last_phases
+from netlist import Netlist
+from simulator import Simulator, SimulationError
+
+
+def address_names(starting_memory, variable_locations, code_length):
+    names = {0: "A", 1: "reserved"}
+    for address in range(2, 2 + 2 * code_length):
+        names[address] = "code"
+    starts = sorted((location, name) for name, location in variable_locations.items() if location >= 2)
+    for i, (location, name) in enumerate(starts):
+        end = starts[i + 1][0] if i + 1 < len(starts) else len(starting_memory)
+        for address in range(location, max(end, location + 1)):
+            names[address] = name
+    return names
+
+
+def simulated_ticks(starting_memory, memory_size, bit_width, max_ticks):
+    simulator = Simulator(Netlist.from_hardware(build(starting_memory, memory_size, bit_width)))
+    freezer = simulator.label_bits("freezer")[0]
+    try:
+        return simulator.run(lambda sim: sim.state[freezer], max_ticks)
+    except SimulationError:
+        return None
+
+
+def profile(text, memory_size=64, bit_width=8, max_steps=100000, simulate=True, max_ticks=1000000):
+    starting_memory, variable_locations = parser.parse_with_locations(text, bit_width=bit_width)
+    code_lines = text.split("\n\n", 1)[0].split("\n")
+    names = address_names(starting_memory, variable_locations, len(code_lines))
+    emulator = Emulator(starting_memory, memory_size, bit_width)
+
+    line_counts = Counter()
+    loop_counts = Counter()
+    reads = Counter()
+    writes = Counter()
+    phases = 0
+    steps = 0
+    while not emulator.halted:
+        if steps >= max_steps:
+            print(f"stopped after {max_steps} instructions without reaching EXIT")
+            break
+        line, op_code = emulator.step()
+        steps += 1
+        line_counts[line] += 1
+        phases += last_phases[op_code] + 1
+        for address in emulator.reads:
+            reads[names.get(address, address)] += 1
+        for address in emulator.writes:
+            writes[names.get(address, address)] += 1
+        target = emulator.instruction_pointer
+        if op_code in (7, 9) and target <= line:
+            loop_counts[(target, line)] += 1
+
+    # how many ticks a phase takes depends on the values, so the real count comes from running the page
+    ticks = None
+    if simulate and emulator.halted:
+        ticks = simulated_ticks(starting_memory, memory_size, bit_width, max_ticks)
+
+    return {
+        "code_lines": code_lines,
+        "steps": steps,
+        "phases": phases,
+        "ticks": ticks,
+        "line_counts": line_counts,
+        "loop_counts": loop_counts,
+        "reads": reads,
+        "writes": writes,
+    }
+
+
+def report(result, top_loops=5):
+    code_lines = result["code_lines"]
+    line_counts = result["line_counts"]
+    print(f"instructions executed: {result['steps']}")
+    print(f"phases: {result['phases']}")
+    if result["ticks"] is not None:
+        print(f"ticks: {result['ticks']}")
+    print()
+    print("line  count  instruction")
+    for line, code_line in enumerate(code_lines):
+        print(f"{line + 1:>4}  {line_counts[line]:>5}  {code_line}")
+    print()
+    print("hottest loops:")
+    loops = sorted(
+        result["loop_counts"].items(),
+        key=lambda item: sum(line_counts[line] for line in range(item[0][0], item[0][1] + 1)),
+        reverse=True,
+    )
+    if not loops:
+        print("  none")
+    for (start, end), count in loops[:top_loops]:
+        body = sum(line_counts[line] for line in range(start, end + 1))
+        print(f"  lines {start + 1}-{end + 1}: jumped back {count} times, {body} instructions executed")
+    print()
+    print("memory:")
+    print("        name  reads  writes")
+    for name in sorted(set(result["reads"]) | set(result["writes"]), key=str):
+        print(f"{name:>12}  {result['reads'][name]:>5}  {result['writes'][name]:>6}")
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("usage: python profiler.py <program.cca>")
+        sys.exit(1)
+    with open(sys.argv[1]) as file:
+        text = file.read()
+    report(profile(text))
+
+
+if __name__ == '__main__':
+    main()
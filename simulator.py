@@ -0,0 +1,115 @@
+import sys
+from collections import Counter
+
+from netlist import Netlist, TRUE, BIT, AND, OR, NOT
+
+
+class SimulationError(RuntimeError):
+    pass
+
+
+class Simulator:
+    # models the page being clicked: each tick switches the pending bit with the highest id,
+    # so the phase chain (allocated first) only moves once everything after it has settled
+    def __init__(self, netlist, state=None):
+        self.netlist = netlist
+        self.state = list(netlist.initial if state is None else state)
+        # checking a radio button unchecks the rest of its group
+        self.groups = {}
+        for start, end in netlist.radio_groups:
+            for id_ in range(start, end + 1):
+                self.groups[id_] = range(start, end + 1)
+        self.rules_by_bit = [[] for _ in self.state]
+        self.dependents = [set() for _ in self.state]
+        node_bits = []
+        for kind, arg in netlist.nodes:
+            if kind == BIT:
+                node_bits.append({arg})
+            elif kind in (AND, OR):
+                node_bits.append(set().union(*(node_bits[child] for child in arg)))
+            elif kind == NOT:
+                node_bits.append(node_bits[arg])
+            else:
+                node_bits.append(set())
+        for rule, (id_, value, node) in enumerate(netlist.rules):
+            self.rules_by_bit[id_].append(rule)
+            if node is not None:
+                for bit in node_bits[node]:
+                    self.dependents[bit].add(id_)
+        self.ticks = 0
+        self.fired = Counter()
+        self.pending = {}
+        for id_ in range(len(self.state)):
+            self.update(id_)
+
+    def evaluate(self, node):
+        kind, arg = self.netlist.nodes[node]
+        if kind == BIT:
+            return self.state[arg]
+        elif kind == AND:
+            return all(self.evaluate(child) for child in arg)
+        elif kind == OR:
+            return any(self.evaluate(child) for child in arg)
+        elif kind == NOT:
+            return not self.evaluate(arg)
+        return kind == TRUE
+
+    def update(self, id_):
+        for rule in self.rules_by_bit[id_]:
+            _, value, node = self.netlist.rules[rule]
+            if value != self.state[id_] and (node is None or self.evaluate(node)):
+                self.pending[id_] = rule
+                return
+        self.pending.pop(id_, None)
+
+    def tick(self):
+        if not self.pending:
+            return None
+        id_ = max(self.pending)
+        self.fired[self.pending[id_]] += 1
+        self.state[id_] = not self.state[id_]
+        self.ticks += 1
+        changed = [id_]
+        if id_ in self.groups and self.state[id_]:
+            for other in self.groups[id_]:
+                if other != id_ and self.state[other]:
+                    self.state[other] = False
+                    changed.append(other)
+        for bit in changed:
+            for dependent in self.dependents[bit] | {bit}:
+                self.update(dependent)
+        return id_
+
+    def run(self, until=None, max_ticks=1000000):
+        start = self.ticks
+        while until is None or not until(self):
+            if self.ticks - start >= max_ticks:
+                raise SimulationError(f"did not finish within {max_ticks} ticks")
+            if self.tick() is None:
+                break
+        return self.ticks - start
+
+    def label_bits(self, name):
+        for (start, end), label in self.netlist.labels:
+            if label == name:
+                return range(start, end + 1)
+        raise KeyError(name)
+
+    def value(self, name):
+        return sum(self.state[bit] << i for i, bit in enumerate(self.label_bits(name)))
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("usage: python simulator.py <design.netlist>")
+        sys.exit(1)
+    simulator = Simulator(Netlist.load(sys.argv[1]))
+    freezer = simulator.label_bits("freezer")[0]
+    simulator.run(lambda sim: sim.state[freezer])
+    print(f"halted after {simulator.ticks} ticks")
+    for _, label in simulator.netlist.labels:
+        print(f"{label}: {simulator.value(label)}")
+
+
+if __name__ == '__main__':
+    main()